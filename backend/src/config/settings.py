@@ -2,7 +2,7 @@
 
 from functools import lru_cache
 
-from pydantic import Field
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -20,14 +20,17 @@ class AuthentikSettings(BaseSettings):
 
     url: str = ""
     client_id: str = ""
-
-    @property
-    def token_url(self) -> str:
-        return f"{self.url}/application/o/token/"
-
-    @property
-    def userinfo_url(self) -> str:
-        return f"{self.url}/application/o/userinfo/"
+    token_url: str = ""
+    userinfo_url: str = ""
+
+    @model_validator(mode="after")
+    def _derive_endpoints(self) -> "AuthentikSettings":
+        # Resolved once at load so request paths read plain attributes
+        if not self.token_url:
+            self.token_url = f"{self.url}/application/o/token/"
+        if not self.userinfo_url:
+            self.userinfo_url = f"{self.url}/application/o/userinfo/"
+        return self
 
 
 class AppSettings(BaseSettings):
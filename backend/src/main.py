@@ -1,12 +1,32 @@
 # main.py
 
+from contextlib import asynccontextmanager
+
+import httpx
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 
 from config.settings import settings
 from router.auth import router as auth_router
 
-app = FastAPI(title="Auth Template API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP/2 client for all upstream OAuth calls, so connections are kept alive
+    # and concurrent requests to the same provider multiplex over one socket
+    app.state.http = httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0),
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=200),
+        http2=True,
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+
+
+app = FastAPI(title="Auth Template API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,9 +39,13 @@ app.add_middleware(
 app.include_router(auth_router)
 
 
+# Prebuilt once; liveness probes get the same encoded body every time
+_HEALTH = Response(b'{"status":"ok"}', media_type="application/json")
+
+
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return _HEALTH
 
 
 if __name__ == "__main__":
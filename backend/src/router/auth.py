@@ -1,15 +1,28 @@
 # src/router/auth.py
 
+import asyncio
+import functools
+from collections.abc import Awaitable, Callable
 from typing import Literal, Optional
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, Header, Path, status
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Header, Path, Request, status
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
 from config.settings import settings
+from utils.circuit_breaker import CircuitBreaker
+from utils.token_cache import TokenCache
 
 router = APIRouter(prefix="/api/login", tags=["auth"])
 
+# Upstream endpoints resolved once at import; settings are cached for the process lifetime
+_GOOGLE_TOKEN_URL = settings.google.token_url
+_GOOGLE_USERINFO_URL = settings.google.userinfo_url
+_AUTHENTIK_TOKEN_URL = settings.authentik.token_url
+_AUTHENTIK_USERINFO_URL = settings.authentik.userinfo_url
+
 
 # --------------------------------------------------
 # Pydantic Models
@@ -49,49 +62,170 @@ class MeResponse(BaseModel):
     role: Optional[str] = None
 
 
+# --------------------------------------------------
+# Shared HTTP Client
+# --------------------------------------------------
+
+def get_http(request: Request) -> httpx.AsyncClient:
+    """Pooled HTTP client created in the app lifespan (see main.py)."""
+    return request.app.state.http
+
+
+# Per-provider breakers: stop calling a provider that keeps timing out or returning 5xx
+_google_breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30)
+_authentik_breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30)
+
+
+async def _call_upstream(
+    http: httpx.AsyncClient,
+    breaker: CircuitBreaker,
+    provider_name: str,
+    method: str,
+    url: str,
+    **kwargs,
+) -> httpx.Response:
+    """Send a request to an OAuth provider, failing fast with 503 while its breaker is open."""
+    if not breaker.allow_request():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{provider_name} OAuth unavailable",
+        )
+    try:
+        resp = await http.request(method, url, **kwargs)
+    except httpx.TransportError:
+        breaker.record_failure()
+        raise
+    if resp.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return resp
+
+
 # --------------------------------------------------
 # Token Verification
 # --------------------------------------------------
 
-async def verify_google_token(token: str) -> dict:
+# Verified userinfo per token hash; failures are never cached here
+_token_cache = TokenCache(max_size=10000, ttl_seconds=300)
+# Recently rejected token hashes, kept briefly so replayed bad tokens skip upstream calls
+_negative_cache = TokenCache(max_size=50000, ttl_seconds=10)
+# Verifications in progress, so concurrent requests with the same token share one upstream check
+_in_flight: dict[bytes, asyncio.Task] = {}
+
+
+async def verify_google_token(token: str, http: httpx.AsyncClient) -> dict:
     """Verify Google access token by calling userinfo endpoint."""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.get(
-            settings.google.userinfo_url,
-            headers={"Authorization": f"Bearer {token}"},
+    try:
+        resp = await _call_upstream(
+            http, _google_breaker, "Google", "GET",
+            _GOOGLE_USERINFO_URL,
+            headers={"Authorization": "Bearer " + token},
         )
-        if resp.status_code != 200:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid Google token",
-            )
-        return resp.json()
+    except httpx.TransportError:
+        resp = None
+    if resp is None or resp.status_code >= 500:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Google OAuth unavailable",
+        )
+    if resp.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid Google token",
+        )
+    return orjson.loads(resp.content)
 
 
-async def verify_authentik_token(token: str) -> dict:
+async def verify_authentik_token(token: str, http: httpx.AsyncClient) -> dict:
     """Verify Authentik access token by calling userinfo endpoint."""
     if not settings.authentik.url:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentik not configured",
         )
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.get(
-            settings.authentik.userinfo_url,
-            headers={"Authorization": f"Bearer {token}"},
+    try:
+        resp = await _call_upstream(
+            http, _authentik_breaker, "Authentik", "GET",
+            _AUTHENTIK_USERINFO_URL,
+            headers={"Authorization": "Bearer " + token},
         )
-        if resp.status_code != 200:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid Authentik token",
-            )
-        return resp.json()
+    except httpx.TransportError:
+        resp = None
+    if resp is None or resp.status_code >= 500:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentik OAuth unavailable",
+        )
+    if resp.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid Authentik token",
+        )
+    return orjson.loads(resp.content)
+
+
+async def _probe(
+    verify: Callable[[str, httpx.AsyncClient], Awaitable[dict]],
+    provider: str,
+    token: str,
+    http: httpx.AsyncClient,
+) -> dict | HTTPException:
+    """Run one provider check, returning tagged userinfo or the rejection."""
+    try:
+        userinfo = await verify(token, http)
+    except HTTPException as exc:
+        return exc
+    userinfo["_provider"] = provider
+    return userinfo
+
+
+async def _verify_uncached(key: bytes, token: str, http: httpx.AsyncClient) -> dict:
+    """Probe both providers and record the outcome in the token caches."""
+    probes = [
+        asyncio.create_task(_probe(verify_google_token, "google", token, http)),
+        asyncio.create_task(_probe(verify_authentik_token, "authentik", token, http)),
+    ]
+    errors = []
+    try:
+        for next_done in asyncio.as_completed(probes):
+            result = await next_done
+            if isinstance(result, dict):
+                # Cache a copy so callers mutating their userinfo can't change the cached entry
+                _token_cache.set(key, dict(result))
+                return result
+            errors.append(result)
+    finally:
+        for probe in probes:
+            probe.cancel()
+
+    # A provider being down is not a verdict on the token: don't 401 or negative-cache it
+    if any(exc.status_code == status.HTTP_503_SERVICE_UNAVAILABLE for exc in errors):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication provider unavailable",
+        )
+
+    _negative_cache.set(key, True)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired token",
+    )
+
+
+def _finish_in_flight(key: bytes, task: asyncio.Task) -> None:
+    """Drop a finished verification from the in-flight map."""
+    _in_flight.pop(key, None)
+    # Mark 401/503 outcomes as retrieved so they aren't logged when every waiter has gone away
+    if not task.cancelled():
+        task.exception()
 
 
 async def verify_bearer_token(
     authorization: Optional[str] = Header(None),
+    http: httpx.AsyncClient = Depends(get_http),
 ) -> dict:
-    """Verify token from Authorization header (tries Google then Authentik)"""
+    """Verify token from Authorization header (probes Google and Authentik concurrently)"""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -99,169 +233,181 @@ async def verify_bearer_token(
         )
 
     token = authorization.removeprefix("Bearer ").strip()
+    key = TokenCache.key(token)
 
-    # Try Google first
-    try:
-        userinfo = await verify_google_token(token)
-        userinfo["_provider"] = "google"
-        return userinfo
-    except HTTPException:
-        pass
+    hit, userinfo = _token_cache.get(key)
+    if hit:
+        return dict(userinfo)
 
-    # Try Authentik
-    try:
-        userinfo = await verify_authentik_token(token)
-        userinfo["_provider"] = "authentik"
-        return userinfo
-    except HTTPException:
-        pass
+    hit, _ = _negative_cache.get(key)
+    if hit:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+        )
 
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid or expired token",
-    )
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_verify_uncached(key, token, http))
+        _in_flight[key] = task
+        task.add_done_callback(functools.partial(_finish_in_flight, key))
+    # Shielded so one caller disconnecting doesn't cancel the check for the others;
+    # each waiter gets its own copy of the shared result
+    return dict(await asyncio.shield(task))
 
 
 # --------------------------------------------------
 # Endpoints
 # --------------------------------------------------
 
-@router.get("/me", response_model=MeResponse)
-async def me(userinfo: dict = Depends(verify_bearer_token)) -> MeResponse:
+# Response models are documented via `responses=` only; skipping `response_model`
+# avoids re-validating outputs that are built here from already-checked data.
+
+@router.get("/me", response_model=None, responses={200: {"model": MeResponse}})
+async def me(userinfo: dict = Depends(verify_bearer_token)) -> Response:
     """Get current user information. Requires valid Bearer token."""
     provider = userinfo.get("_provider", "authentik")
-    return MeResponse(
-        sub=userinfo.get("sub"),
-        email=userinfo.get("email", ""),
-        name=userinfo.get("preferred_username") or userinfo.get("name"),
-        picture=userinfo.get("picture"),
-        provider=provider,
-        role=None,  # Add role logic here if needed
-    )
-
-
-@router.post("/{provider}/token", response_model=TokenResponse)
+    body = orjson.dumps({
+        "sub": userinfo.get("sub"),
+        "email": userinfo.get("email", ""),
+        "name": userinfo.get("preferred_username") or userinfo.get("name"),
+        "picture": userinfo.get("picture"),
+        "provider": provider,
+        "role": None,  # Add role logic here if needed
+    })
+    return Response(body, media_type="application/json")
+
+
+@router.post("/{provider}/token", response_model=None, responses={200: {"model": TokenResponse}})
 async def token_exchange(
     request: TokenRequest,
     provider: Literal["google", "authentik"] = Path(..., description="OAuth provider"),
-) -> TokenResponse:
+    http: httpx.AsyncClient = Depends(get_http),
+) -> Response:
     """Exchange authorization code for tokens. Supports Google and Authentik."""
     if provider == "google":
-        return await _exchange_google(request)
+        tokens = await _exchange_google(request, http)
     else:
-        return await _exchange_authentik(request)
+        tokens = await _exchange_authentik(request, http)
+    return Response(orjson.dumps(tokens.model_dump()), media_type="application/json")
 
 
-async def _exchange_google(request: TokenRequest) -> TokenResponse:
+async def _exchange_google(request: TokenRequest, http: httpx.AsyncClient) -> TokenResponse:
     """Exchange Google authorization code for tokens."""
     if not settings.google.client_secret:
         raise HTTPException(status_code=500, detail="Google OAuth not configured")
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            resp = await client.post(
-                settings.google.token_url,
-                data={
-                    "grant_type": "authorization_code",
-                    "code": request.code,
-                    "redirect_uri": request.redirect_uri,
-                    "client_id": settings.google.client_id,
-                    "client_secret": settings.google.client_secret,
-                    "code_verifier": request.code_verifier,
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-            )
-
-            if resp.status_code != 200:
-                detail = resp.json() if "application/json" in resp.headers.get("content-type", "") else resp.text
-                raise HTTPException(status_code=400, detail=f"Google token exchange failed: {detail}")
-
-            tokens = resp.json()
-
-            # Fetch user info
-            userinfo_resp = await client.get(
-                settings.google.userinfo_url,
-                headers={"Authorization": f"Bearer {tokens['access_token']}"},
-            )
-
-            if userinfo_resp.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to fetch Google user info")
-
-            userinfo = userinfo_resp.json()
-
-            return TokenResponse(
-                access_token=tokens["access_token"],
-                refresh_token=tokens.get("refresh_token"),
-                id_token=tokens.get("id_token"),
-                expires_in=tokens.get("expires_in"),
-                userinfo=UserInfo(
-                    sub=userinfo["sub"],
-                    email=userinfo["email"],
-                    name=userinfo.get("name"),
-                    picture=userinfo.get("picture"),
-                ),
-            )
-
-        except httpx.TimeoutException:
-            raise HTTPException(status_code=504, detail="Google OAuth timeout")
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-
-async def _exchange_authentik(request: TokenRequest) -> TokenResponse:
+    try:
+        resp = await _call_upstream(
+            http, _google_breaker, "Google", "POST",
+            _GOOGLE_TOKEN_URL,
+            data={
+                "grant_type": "authorization_code",
+                "code": request.code,
+                "redirect_uri": request.redirect_uri,
+                "client_id": settings.google.client_id,
+                "client_secret": settings.google.client_secret,
+                "code_verifier": request.code_verifier,
+            },
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=15.0,
+        )
+
+        if resp.status_code != 200:
+            detail = orjson.loads(resp.content) if "application/json" in resp.headers.get("content-type", "") else resp.text
+            raise HTTPException(status_code=400, detail=f"Google token exchange failed: {detail}")
+
+        tokens = orjson.loads(resp.content)
+
+        # Fetch user info
+        userinfo_resp = await _call_upstream(
+            http, _google_breaker, "Google", "GET",
+            _GOOGLE_USERINFO_URL,
+            headers={"Authorization": "Bearer " + tokens["access_token"]},
+            timeout=15.0,
+        )
+
+        if userinfo_resp.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to fetch Google user info")
+
+        userinfo = orjson.loads(userinfo_resp.content)
+
+        return TokenResponse(
+            access_token=tokens["access_token"],
+            refresh_token=tokens.get("refresh_token"),
+            id_token=tokens.get("id_token"),
+            expires_in=tokens.get("expires_in"),
+            userinfo=UserInfo(
+                sub=userinfo["sub"],
+                email=userinfo["email"],
+                name=userinfo.get("name"),
+                picture=userinfo.get("picture"),
+            ),
+        )
+
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Google OAuth timeout")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _exchange_authentik(request: TokenRequest, http: httpx.AsyncClient) -> TokenResponse:
     """Exchange Authentik authorization code for tokens (public client)."""
     if not settings.authentik.url or not settings.authentik.client_id:
         raise HTTPException(status_code=500, detail="Authentik OAuth not configured")
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            resp = await client.post(
-                settings.authentik.token_url,
-                data={
-                    "grant_type": "authorization_code",
-                    "code": request.code,
-                    "redirect_uri": request.redirect_uri,
-                    "client_id": settings.authentik.client_id,
-                    "code_verifier": request.code_verifier,
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-            )
-
-            if resp.status_code != 200:
-                detail = resp.json() if "application/json" in resp.headers.get("content-type", "") else resp.text
-                raise HTTPException(status_code=400, detail=f"Authentik token exchange failed: {detail}")
-
-            tokens = resp.json()
-
-            # Fetch user info
-            userinfo_resp = await client.get(
-                settings.authentik.userinfo_url,
-                headers={"Authorization": f"Bearer {tokens['access_token']}"},
-            )
-
-            if userinfo_resp.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to fetch Authentik user info")
-
-            userinfo = userinfo_resp.json()
-
-            return TokenResponse(
-                access_token=tokens["access_token"],
-                refresh_token=tokens.get("refresh_token"),
-                id_token=tokens.get("id_token"),
-                expires_in=tokens.get("expires_in"),
-                userinfo=UserInfo(
-                    sub=userinfo["sub"],
-                    email=userinfo["email"],
-                    name=userinfo.get("preferred_username") or userinfo.get("name"),
-                    picture=userinfo.get("picture"),
-                ),
-            )
-
-        except httpx.TimeoutException:
-            raise HTTPException(status_code=504, detail="Authentik OAuth timeout")
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    try:
+        resp = await _call_upstream(
+            http, _authentik_breaker, "Authentik", "POST",
+            _AUTHENTIK_TOKEN_URL,
+            data={
+                "grant_type": "authorization_code",
+                "code": request.code,
+                "redirect_uri": request.redirect_uri,
+                "client_id": settings.authentik.client_id,
+                "code_verifier": request.code_verifier,
+            },
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=15.0,
+        )
+
+        if resp.status_code != 200:
+            detail = orjson.loads(resp.content) if "application/json" in resp.headers.get("content-type", "") else resp.text
+            raise HTTPException(status_code=400, detail=f"Authentik token exchange failed: {detail}")
+
+        tokens = orjson.loads(resp.content)
+
+        # Fetch user info
+        userinfo_resp = await _call_upstream(
+            http, _authentik_breaker, "Authentik", "GET",
+            _AUTHENTIK_USERINFO_URL,
+            headers={"Authorization": "Bearer " + tokens["access_token"]},
+            timeout=15.0,
+        )
+
+        if userinfo_resp.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to fetch Authentik user info")
+
+        userinfo = orjson.loads(userinfo_resp.content)
+
+        return TokenResponse(
+            access_token=tokens["access_token"],
+            refresh_token=tokens.get("refresh_token"),
+            id_token=tokens.get("id_token"),
+            expires_in=tokens.get("expires_in"),
+            userinfo=UserInfo(
+                sub=userinfo["sub"],
+                email=userinfo["email"],
+                name=userinfo.get("preferred_username") or userinfo.get("name"),
+                picture=userinfo.get("picture"),
+            ),
+        )
+
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Authentik OAuth timeout")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
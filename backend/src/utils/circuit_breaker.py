@@ -0,0 +1,57 @@
+# utils/circuit_breaker.py
+
+import time
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures, backing off exponentially while they persist."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30,
+        max_recovery_timeout: float = 300,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._cooldown = recovery_timeout
+        self._half_open = False
+        self._trial_started = 0.0
+
+    def allow_request(self) -> bool:
+        """Admit a call: always while closed, never while cooling down, then one trial at a time."""
+        if self._opened_at is None:
+            return True
+        now = time.monotonic()
+        if not self._half_open:
+            if now - self._opened_at < self._cooldown:
+                return False
+            self._half_open = True
+        elif now - self._trial_started < self._cooldown:
+            # A trial is already in flight; let another through only if it never reported back
+            return False
+        self._trial_started = now
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._cooldown = self.recovery_timeout
+        self._half_open = False
+
+    def record_failure(self) -> None:
+        if self._half_open:
+            # A trial request after the cooldown failed: reopen for twice as long
+            self._cooldown = min(self._cooldown * 2, self.max_recovery_timeout)
+            self._opened_at = time.monotonic()
+            self._half_open = False
+        elif self._opened_at is not None:
+            # Calls admitted before the breaker opened; the outage is already counted
+            return
+        else:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
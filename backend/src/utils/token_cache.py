@@ -0,0 +1,45 @@
+# utils/token_cache.py
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class TokenCache:
+    """Bounded in-memory TTL cache keyed by a hash of the bearer token."""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[bytes, tuple[float, Any]] = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        """Hash the raw token so it is never stored in the cache."""
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes) -> tuple[bool, Any]:
+        """Return (hit, value); expired entries are dropped on access."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        return True, value
+
+    def set(self, key: bytes, value: Any) -> None:
+        """Store value, honouring its `exp` claim if it expires before the TTL."""
+        ttl = self.ttl_seconds
+        exp = value.get("exp") if isinstance(value, dict) else None
+        if isinstance(exp, int | float):
+            ttl = min(ttl, exp - time.time())
+        if ttl <= 0:
+            return
+
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)